@@ -0,0 +1,73 @@
+import os
+import shutil
+import time
+import threading
+import logging
+
+# Audio storage and expiry. Kept free of Flask/yt-dlp imports so the gunicorn
+# arbiter can run the cleanup thread without loading the app (see gunicorn.conf.py).
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# tmpfs pages count against the container's memory, and Docker's default /dev/shm
+# is only 64 MB, so only use it for audio when it is at least this big
+MIN_TMPFS_SIZE = 1024 * 1024 * 1024
+
+def _default_audio_dir():
+    """Keep converted MP3s on tmpfs when /dev/shm is large enough, else on disk"""
+    try:
+        if shutil.disk_usage('/dev/shm').total >= MIN_TMPFS_SIZE:
+            return '/dev/shm/audios'
+    except OSError:
+        pass
+    return 'audios'
+
+AUDIO_DIR = os.environ.get('AUDIO_DIR') or _default_audio_dir()
+
+# Create audios directory if it doesn't exist
+os.makedirs(AUDIO_DIR, exist_ok=True)
+AUDIO_ROOT = os.path.realpath(AUDIO_DIR)
+
+# Define the retention period in seconds (2 hours)
+RETENTION_PERIOD = 2 * 60 * 60
+
+# Per-download working directories inside AUDIO_DIR
+JOB_DIR_PREFIX = '.job-'
+
+def delete_expired_files():
+    """Delete files older than retention period"""
+    current_timestamp = int(time.time())
+
+    try:
+        if not os.path.exists(AUDIO_DIR):
+            return
+
+        # scandir's DirEntry caches the type and stat result, saving syscalls
+        with os.scandir(AUDIO_DIR) as entries:
+            for entry in entries:
+                if (entry.is_file() and
+                    current_timestamp > entry.stat().st_mtime + RETENTION_PERIOD):
+                    try:
+                        os.remove(entry.path)
+                        logger.info(f"Deleted expired file: {entry.path}")
+                    except Exception as e:
+                        logger.error(f"Error deleting file {entry.path}: {e}")
+                elif (entry.name.startswith(JOB_DIR_PREFIX) and entry.is_dir() and
+                      current_timestamp > entry.stat().st_mtime + RETENTION_PERIOD):
+                    # Left behind by a download process that was killed mid-job
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    logger.info(f"Deleted stale job directory: {entry.path}")
+
+    except Exception as e:
+        logger.error(f"Error in delete_expired_files: {e}")
+
+def _cleanup_loop():
+    """Delete expired files every 100 seconds"""
+    while True:
+        delete_expired_files()
+        time.sleep(100)
+
+def start_cleanup_thread():
+    """Start the file cleanup thread; call once per server, not per worker"""
+    threading.Thread(target=_cleanup_loop, daemon=True).start()
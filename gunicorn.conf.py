@@ -0,0 +1,22 @@
+import multiprocessing
+import os
+
+# Gunicorn configuration, picked up automatically by `gunicorn main:app`
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threaded workers so a long-running /download doesn't block other requests.
+# gthread is the only supported worker class: the download pool's progress
+# queue and the cleanup thread rely on real threads and blocking sockets.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# yt-dlp + ffmpeg jobs can take several minutes
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+
+
+def when_ready(server):
+    # Run the expired-file cleanup once in the arbiter instead of in every worker
+    from audio_files import start_cleanup_thread
+    start_cleanup_thread()
@@ -1,104 +1,383 @@
-from flask import Flask, request, jsonify, Response, stream_with_context, make_response
+from flask import Flask, request, jsonify, Response, stream_with_context, make_response, send_file
+from flask.json.provider import JSONProvider
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import wrap_file
 from youtube_search import YoutubeSearch
 import os
 import re
 import time
+import concurrent.futures
+import fcntl
+import itertools
+import multiprocessing
+import queue
+import shutil
+import tempfile
+from functools import lru_cache
 from flask_cors import CORS
-import json
-from threading import Thread
+import orjson
 import threading
 import yt_dlp
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import logging
+from audio_files import AUDIO_DIR, AUDIO_ROOT, JOB_DIR_PREFIX, RETENTION_PERIOD, start_cleanup_thread
 
-# Create audios directory if it doesn't exist
-os.makedirs('audios', exist_ok=True)
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the str round-trip: orjson already returns bytes
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 cors = CORS(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Define the retention period in seconds (2 hours)
-RETENTION_PERIOD = 2 * 60 * 60
+# When running behind Nginx, hand audio delivery off via X-Accel-Redirect, e.g.
+# X_ACCEL_REDIRECT_PREFIX=/internal-audios/ with:
+#   location /internal-audios/ { internal; alias <AUDIO_DIR>/; }
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
 
-# Configure rate limiting
+# YouTube video id in watch, youtu.be and shorts URLs
+VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/)([\w-]{11})(?![\w-])')
+
+# How long search results are cached (10 minutes)
+SEARCH_CACHE_TTL = 10 * 60
+
+# Configure rate limiting; point REDIS_URL at Redis so all gunicorn workers share one set of counters
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["30 per second"],
-    storage_uri="memory://",
+    storage_uri=os.environ.get('REDIS_URL', "memory://"),
+    strategy="moving-window",
 )
 
+# Downloads currently in progress, keyed by video id
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# yt-dlp runs in a per-worker process pool so it doesn't hold this process's GIL.
+# DOWNLOAD_WORKERS caps concurrent jobs across the whole host: every job first takes
+# one of that many lock files in DOWNLOAD_SLOT_DIR, whichever web worker it came from.
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', os.cpu_count() or 1))
+DOWNLOAD_SLOT_DIR = os.path.join(AUDIO_DIR, '.slots')
+_download_pool = None
+_pool_events = None
+_download_pool_lock = threading.Lock()
+
+# Progress queues of this worker's jobs, keyed by job number
+_job_queues = {}
+_job_numbers = itertools.count()
+
+# Send a heartbeat line if a download reports no progress for this many seconds
+PROGRESS_HEARTBEAT = 10
+
 @app.route('/')
 def nothing():
     response = jsonify({'msg': 'Use /download or /audios/<filename>'})
     response.headers.add('Content-Type', 'application/json')
     return response
 
-def generate(host_url, video_url):
-    """Generate audio file from YouTube video URL with cookie authentication"""
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': 'audios/%(id)s.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '256',
-        }],
-        'verbose': False,
-        'no_warnings': True,
-        # Add cookie support for YouTube authentication
-        'cookiefile': 'cookies.txt',  # Use cookies if available
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-    }
+def ndjson(obj):
+    """Encode obj as one line of newline-delimited JSON"""
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+def audio_expiration(video_id):
+    """Return the expiration timestamp of a converted MP3 on disk, or None if missing/expired"""
+    try:
+        expiration_timestamp = int(os.path.getmtime(os.path.join(AUDIO_DIR, f"{video_id}.mp3"))) + RETENTION_PERIOD
+    except OSError:
+        return None
+    return expiration_timestamp if expiration_timestamp > time.time() else None
+
+def parse_video_id(video_url):
+    """Extract the YouTube video id from a URL, or None if it isn't recognized"""
+    match = VIDEO_ID_RE.search(video_url)
+    return match.group(1) if match else None
+
+def audio_response(video_id, thumbnail_url, expiration_timestamp):
+    """Build the JSON line pointing the client at a converted MP3"""
+    # Get base URL dynamically
+    base_url = request.url_root.rstrip('/')
     
-    # Try to use cookies from browser if available
+    response_dict = {
+        'img': thumbnail_url,
+        'direct_link': f"{base_url}/audios/{video_id}.mp3",
+        'expiration_timestamp': expiration_timestamp
+    }
+    return ndjson(response_dict)
+
+# yt-dlp options shared by every download
+YDL_OPTS = {
+    # Prefer MP3 sources (FFmpegExtractAudio then stream-copies), then AAC over Opus/WebM
+    'format': 'bestaudio[acodec^=mp3]/bestaudio[ext=m4a]/bestaudio/best',
+    # Relative to the per-job directory set in _do_download
+    'outtmpl': '%(id)s.%(ext)s',
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '256',
+    }],
+    # 5 minutes limit, checked by yt-dlp before it downloads anything
+    'match_filter': yt_dlp.utils.match_filter_func('duration <= 300'),
+    # watch?v=X&list=Y means just video X; bare playlists are rejected in _do_download
+    'noplaylist': True,
+    # Keep the download time as mtime so retention is counted from now
+    'updatetime': False,
+    'verbose': False,
+    'no_warnings': True,
+    # Add cookie support for YouTube authentication
+    'cookiefile': 'cookies.txt',  # Use cookies if available
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+}
+
+# Per pool process: the reused YoutubeDL, the pool's event queue and the current job.
+# Pool processes run one job at a time, so none of these needs a lock.
+_ydl = None
+_progress_queue = None
+_current_job = None
+_last_progress_report = 0
+
+def init_download_process(events):
+    """Pool process initializer: keep the queue progress events are sent back through"""
+    global _progress_queue
+    _progress_queue = events
+
+def report_progress(event):
+    """Send a progress event for the current job back to the web worker"""
+    if _progress_queue is not None and _current_job is not None:
+        _progress_queue.put((_current_job, event))
+
+def progress_hook(d):
+    """yt-dlp progress hook forwarding (at most once a second) to the current job's queue"""
+    global _last_progress_report
+    if d['status'] == 'finished':
+        report_progress({'status': 'converting'})
+    elif d['status'] == 'downloading' and time.monotonic() - _last_progress_report >= 1:
+        _last_progress_report = time.monotonic()
+        report_progress({
+            'status': 'downloading',
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+        })
+
+def get_ydl():
+    """Return this process's YoutubeDL, creating it on first use"""
+    global _ydl
+    if _ydl is None:
+        # Try to use cookies from browser if available
+        ydl = None
+        try:
+            # Older yt-dlp loads cookies in __init__, newer ones on first cookiejar access
+            ydl = yt_dlp.YoutubeDL({**YDL_OPTS, 'cookiesfrombrowser': ('chrome',)})
+            ydl.cookiejar
+        except Exception:
+            # If browser cookies are not available, continue without them
+            if ydl is not None:
+                try:
+                    ydl.close()
+                except Exception:
+                    pass  # close() saves cookies, which fails the same way
+            ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+        ydl.add_progress_hook(progress_hook)
+        _ydl = ydl
+    return _ydl
+
+def acquire_download_slot():
+    """Block until one of the host's DOWNLOAD_WORKERS slots is free; closing the file frees it"""
+    os.makedirs(DOWNLOAD_SLOT_DIR, exist_ok=True)
+    while True:
+        for slot in range(DOWNLOAD_WORKERS):
+            slot_file = open(os.path.join(DOWNLOAD_SLOT_DIR, str(slot)), 'a')
+            try:
+                # The kernel drops the lock if this process dies mid-job
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot_file.close()
+                continue
+            return slot_file
+        time.sleep(0.5)
+
+def _do_download(job, video_url):
+    """Fetch and convert a video in a pool process; returns its id and thumbnail, or None if too long"""
+    global _current_job
+    _current_job = job
+    slot = acquire_download_slot()
     try:
-        ydl_opts['cookiesfrombrowser'] = ('chrome',)
-    except:
-        # If browser cookies are not available, continue without them
-        pass
+        ydl = get_ydl()
+        # Convert in a private directory so AUDIO_DIR only ever holds complete MP3s;
+        # FFmpegExtractAudio otherwise writes straight into the final <id>.mp3
+        job_dir = tempfile.mkdtemp(prefix=JOB_DIR_PREFIX, dir=AUDIO_DIR)
+        ydl.params['paths'] = {'home': job_dir}
+        try:
+            # One extraction: match_filter skips the download for videos that are too long
+            report_progress({'status': 'extracting'})
+            info_dict = ydl.extract_info(video_url, download=False, process=False)
+            while info_dict and info_dict.get('_type') in ('url', 'url_transparent'):
+                # Follow redirects (e.g. a watch?v=X&list=Y tab URL) without processing them
+                info_dict = ydl.extract_info(info_dict['url'], download=False, process=False, ie_key=info_dict.get('ie_key'))
+            if not info_dict or info_dict.get('_type', 'video') != 'video':
+                # Playlists and channels would download every entry before the duration check
+                raise ValueError('video_url must point to a single video, not a playlist or channel.')
+            info_dict = ydl.process_ie_result(info_dict, download=True)
+            duration = info_dict.get('duration') if info_dict else None
+
+            if not (duration and duration <= 300):  # 5 minutes limit
+                return None
+            
+            video_id = info_dict.get('id')
+            os.replace(os.path.join(job_dir, f"{video_id}.mp3"), os.path.join(AUDIO_DIR, f"{video_id}.mp3"))
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        # Persist refreshed cookies, as leaving the old per-request `with` block did
+        ydl.save_cookies()
+        return {'id': video_id, 'thumbnail': info_dict.get('thumbnail')}
+            
+    except Exception as e:
+        # yt-dlp errors hold tracebacks that can't be pickled back to the web worker
+        raise RuntimeError(str(e)) from None
+    finally:
+        slot.close()
+        _current_job = None
+
+def dispatch_progress(events):
+    """Route a pool's progress events to the queues of the jobs they belong to"""
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        job, event = item
+        job_queue = _job_queues.get(job)
+        if job_queue is not None:
+            job_queue.put(event)
+
+def get_download_pool():
+    """Return this process's download pool, creating it on first use"""
+    global _download_pool, _pool_events
+    with _download_pool_lock:
+        if _download_pool is None:
+            # spawn rather than fork: web workers are multi-threaded
+            context = multiprocessing.get_context('spawn')
+            # One queue per pool instead of a Manager process per web worker
+            _pool_events = context.Queue()
+            # Processes are spawned on demand, up to one per concurrent job
+            _download_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=DOWNLOAD_WORKERS,
+                mp_context=context,
+                initializer=init_download_process,
+                initargs=(_pool_events,),
+            )
+            threading.Thread(target=dispatch_progress, args=(_pool_events,), daemon=True).start()
+        return _download_pool
+
+def discard_download_pool(pool):
+    """Drop a broken pool (e.g. a process was OOM-killed) so the next request starts a fresh one"""
+    global _download_pool, _pool_events
+    with _download_pool_lock:
+        if _download_pool is pool:
+            _pool_events.put(None)  # stops its dispatch_progress thread
+            _download_pool = None
+            _pool_events = None
+
+def submit_download(key, video_url):
+    """Start _do_download in the pool unless the same key is in flight; returns (future, progress queue or None)"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+    if future is not None:
+        return future, None
+    
+    # Set up the pool and queue outside the lock so unrelated downloads aren't held up
+    pool = get_download_pool()
+    job = next(_job_numbers)
+    progress_queue = queue.Queue()
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            # Another request started this video in the meantime; drop our queue
+            return future, None
+        
+        _job_queues[job] = progress_queue
+        try:
+            future = pool.submit(_do_download, job, video_url)
+        except concurrent.futures.process.BrokenProcessPool:
+            del _job_queues[job]
+            discard_download_pool(pool)
+            raise
+        _inflight[key] = future
+
+    def on_done(done):
+        with _inflight_lock:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+        _job_queues.pop(job, None)
+        if not done.cancelled() and isinstance(done.exception(), concurrent.futures.process.BrokenProcessPool):
+            discard_download_pool(pool)
+
+    future.add_done_callback(on_done)
+    return future, progress_queue
+
+def progress_events(future, progress_queue):
+    """Yield progress events from a download job until it finishes"""
+    last_event = time.monotonic()
+    while not future.done():
+        try:
+            event = progress_queue.get(timeout=0.5)
+        except queue.Empty:
+            if time.monotonic() - last_event < PROGRESS_HEARTBEAT:
+                continue
+            # Keep the client and any proxies from timing out an idle stream
+            event = {'status': 'processing'}
+        last_event = time.monotonic()
+        yield event
+
+def generate(host_url, video_url):
+    """Generate audio file from YouTube video URL, streaming progress as NDJSON"""
+    # Answer straight from disk if this video was already converted
+    video_id = parse_video_id(video_url)
+    if video_id and video_id not in _inflight:
+        expiration_timestamp = audio_expiration(video_id)
+        if expiration_timestamp:
+            thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+            yield audio_response(video_id, thumbnail_url, expiration_timestamp)
+            return
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract video info without downloading
-            info_dict = ydl.extract_info(video_url, download=False)
-            duration = info_dict.get('duration')
-
-            if duration and duration <= 300:  # 5 minutes limit
-                # Download the video
-                info_dict = ydl.extract_info(video_url, download=True)
-                thumbnail_url = info_dict.get('thumbnail')
-                video_id = info_dict.get('id')
-
-                expiration_timestamp = int(time.time()) + RETENTION_PERIOD
-                
-                # Get base URL dynamically
-                base_url = request.url_root.rstrip('/')
-                
-                response_dict = {
-                    'img': thumbnail_url,
-                    'direct_link': f"{base_url}/audios/{video_id}.mp3",
-                    'expiration_timestamp': expiration_timestamp
-                }
-                response_json = json.dumps(response_dict)
-                response_bytes = response_json.encode('utf-8')
-                
-                with app.app_context():
-                    yield response_bytes
-            else:
-                response_dict = {
-                    'error': 'Video duration must be less than or equal to 5 minutes.'
-                }
-                response_json = json.dumps(response_dict)
-                response_bytes = response_json.encode('utf-8')
+        # Download in the process pool, joining any in-flight download of the same video
+        future, progress_queue = submit_download(video_id or video_url, video_url)
+        yield ndjson({'status': 'queued'})
+        
+        # Callers joining another download only get heartbeats
+        for event in progress_events(future, progress_queue or queue.Queue()):
+            yield ndjson(event)
+        result = future.result()
+
+        if result:
+            expiration_timestamp = audio_expiration(result['id']) or int(time.time()) + RETENTION_PERIOD
+            response_bytes = audio_response(result['id'], result['thumbnail'], expiration_timestamp)
+            
+            with app.app_context():
                 yield response_bytes
+        else:
+            response_dict = {
+                'error': 'Video duration must be less than or equal to 5 minutes.'
+            }
+            response_bytes = ndjson(response_dict)
+            yield response_bytes
                 
     except Exception as e:
         error_msg = str(e)
@@ -115,21 +394,31 @@ def generate(host_url, video_url):
                 'error': f'Error processing video: {error_msg}'
             }
         
-        response_json = json.dumps(response_dict)
-        response_bytes = response_json.encode('utf-8')
+        response_bytes = ndjson(response_dict)
         yield response_bytes
 
-# ... rest of the code remains the same as before
-
+@lru_cache(maxsize=1024)
+def search_short_videos(query, cache_bucket):
+    """Search YouTube for videos shorter than 5 minutes (cached per query)"""
+    # Use YoutubeSearch from youtube-search library
+    results = YoutubeSearch(query, max_results=15).to_dict()
+    search_results = []
+    
+    for video in results:
+        parts = video.get("duration", "").split(":")
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():  # MM:SS format
+            total_seconds = int(parts[0]) * 60 + int(parts[1])
+            if total_seconds < 300:  # Less than 5 minutes
+                # Construct full YouTube URL
+                video_url = f"https://www.youtube.com{video.get('url_suffix', '')}"
                 
-    except Exception as e:
-        logger.error(f"Error processing video {video_url}: {e}")
-        response_dict = {
-            'error': f'Error processing video: {str(e)}'
-        }
-        response_json = json.dumps(response_dict)
-        response_bytes = response_json.encode('utf-8')
-        yield response_bytes
+                search_results.append({
+                    'title': video.get("title", ""),
+                    'url': video_url,
+                    'thumbnail': video.get("thumbnails", [""])[0] if video.get("thumbnails") else ""
+                })
+    
+    return search_results
 
 @app.route('/search', methods=['GET'])
 @limiter.limit("5/minute", error_message="Too many requests")
@@ -140,29 +429,8 @@ def search():
         return jsonify({'error': 'Invalid search query'})
     
     try:
-        # Use YoutubeSearch from youtube-search library
-        results = YoutubeSearch(q, max_results=15).to_dict()
-        search_results = []
-        
-        for video in results:
-            duration = video.get("duration", "")
-            if ":" in duration:
-                parts = duration.split(":")
-                if len(parts) == 2:  # MM:SS format
-                    try:
-                        minutes, seconds = map(int, parts)
-                        total_seconds = minutes * 60 + seconds
-                        if total_seconds < 300:  # Less than 5 minutes
-                            # Construct full YouTube URL
-                            video_url = f"https://www.youtube.com{video.get('url_suffix', '')}"
-                            
-                            search_results.append({
-                                'title': video.get("title", ""),
-                                'url': video_url,
-                                'thumbnail': video.get("thumbnails", [""])[0] if video.get("thumbnails") else ""
-                            })
-                    except (ValueError, IndexError):
-                        continue
+        # The time bucket changes every SEARCH_CACHE_TTL seconds, expiring old entries
+        search_results = search_short_videos(q.lower().strip(), int(time.time() // SEARCH_CACHE_TTL))
         
         response = jsonify({'search': search_results})
         response.headers.add('Content-Type', 'application/json')
@@ -183,134 +451,83 @@ def download_audio():
     host_url = request.base_url + '/'
     return Response(
         stream_with_context(generate(host_url, video_url)), 
-        mimetype='application/json'
+        mimetype='application/x-ndjson'
     )
 
-@app.route('/audios/<path:filename>', methods=['GET'])
+class FileRange:
+    """Read-only view of bytes [start, stop) of a file that keeps fileno() for sendfile(2)"""
+
+    def __init__(self, file_path, start, stop):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = stop - start
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+@app.route('/audios/<filename>', methods=['GET'])
 @limiter.limit("2/5seconds", error_message="Too many requests")
 def serve_audio(filename):
     """Serve audio files with range request support"""
-    root_dir = os.getcwd()
-    file_path = os.path.join(root_dir, 'audios', filename)
+    file_path = os.path.realpath(os.path.join(AUDIO_ROOT, filename))
     
-    # Security check: ensure filename doesn't contain path traversal
-    if '..' in filename or filename.startswith('/'):
+    # Security check: ensure the resolved path stays inside the audio directory
+    if os.path.commonpath([AUDIO_ROOT, file_path]) != AUDIO_ROOT:
         return make_response('Invalid filename', 400)
     
     # Check if file exists
     if not os.path.isfile(file_path):
         return make_response('Audio file not found', 404)
     
-    # Get file size
-    file_size = os.path.getsize(file_path)
-    
-    # Parse Range header
-    range_header = request.headers.get('Range')
-    
-    if range_header:
-        start_pos, end_pos = parse_range_header(range_header, file_size)
-        response = make_partial_response(file_path, start_pos, end_pos, file_size)
+    if X_ACCEL_REDIRECT_PREFIX:
+        # Nginx serves the bytes (Range, ETag, sendfile); no body from Python
+        response = make_response('')
+        response.headers.set('X-Accel-Redirect', f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{filename}")
+        response.headers.set('Content-Type', 'audio/mpeg')
     else:
-        response = make_entire_response(file_path, file_size)
+        # Let Werkzeug handle Range/ETag/Last-Modified and stream the file
+        # through wsgi.file_wrapper instead of reading it into memory
+        try:
+            response = send_file(file_path, mimetype='audio/mpeg', conditional=True, etag=True)
+            if response.status_code == 206:
+                # Werkzeug wraps ranges in a Python iterator, which gunicorn can't
+                # sendfile(); give it a file seeked to the range start instead
+                content_range = response.content_range
+                response.response.close()
+                response.response = wrap_file(
+                    request.environ,
+                    FileRange(file_path, content_range.start, content_range.stop),
+                    buffer_size=65536,
+                )
+        except HTTPException:
+            # e.g. 416 for an unsatisfiable Range; let Flask answer it
+            raise
+        except Exception as e:
+            logger.error(f"Error serving audio file {file_path}: {e}")
+            return make_response('Error reading file', 500)
     
     # Set CORS headers
     response.headers.set('Access-Control-Allow-Origin', '*')
     response.headers.set('Access-Control-Allow-Methods', 'GET')
-    response.headers.set('Content-Type', 'audio/mpeg')
     
     return response
 
-def parse_range_header(range_header, file_size):
-    """Parse HTTP Range header"""
-    range_match = re.search(r'(\d+)-(\d*)', range_header)
-    if not range_match:
-        return 0, file_size - 1
-    
-    start_pos = int(range_match.group(1)) if range_match.group(1) else 0
-    end_pos = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-    
-    # Ensure valid range
-    start_pos = max(0, min(start_pos, file_size - 1))
-    end_pos = max(start_pos, min(end_pos, file_size - 1))
-    
-    return start_pos, end_pos
-
-def make_partial_response(file_path, start_pos, end_pos, file_size):
-    """Create partial content response"""
-    try:
-        with open(file_path, 'rb') as file:
-            file.seek(start_pos)
-            content_length = end_pos - start_pos + 1
-            content = file.read(content_length)
-        
-        response = make_response(content)
-        response.headers.set('Content-Range', f'bytes {start_pos}-{end_pos}/{file_size}')
-        response.headers.set('Content-Length', str(content_length))
-        response.status_code = 206
-        
-        return response
-        
-    except Exception as e:
-        logger.error(f"Error creating partial response: {e}")
-        return make_response('Error reading file', 500)
-
-def make_entire_response(file_path, file_size):
-    """Create full content response"""
-    try:
-        with open(file_path, 'rb') as file:
-            content = file.read()
-        
-        response = make_response(content)
-        response.headers.set('Content-Length', str(file_size))
-        
-        return response
-        
-    except Exception as e:
-        logger.error(f"Error creating full response: {e}")
-        return make_response('Error reading file', 500)
-
-def delete_expired_files():
-    """Delete files older than retention period"""
-    current_timestamp = int(time.time())
-    
-    try:
-        if not os.path.exists('audios'):
-            return
-            
-        for file_name in os.listdir('audios'):
-            file_path = os.path.join('audios', file_name)
-            
-            if (os.path.isfile(file_path) and
-                current_timestamp > os.path.getmtime(file_path) + RETENTION_PERIOD):
-                try:
-                    os.remove(file_path)
-                    logger.info(f"Deleted expired file: {file_path}")
-                except Exception as e:
-                    logger.error(f"Error deleting file {file_path}: {e}")
-                    
-    except Exception as e:
-        logger.error(f"Error in delete_expired_files: {e}")
-
-def delete_files_task():
-    """Scheduled task to delete expired files"""
-    delete_expired_files()
-    # Schedule next run in 100 seconds
-    timer = threading.Timer(100, delete_files_task)
-    timer.daemon = True
-    timer.start()
-
 def run():
-    """Run the Flask application"""
+    """Run the Flask development server (production uses gunicorn, see gunicorn.conf.py)"""
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
-
-def keep_alive():
-    """Keep the application alive in a separate thread"""
-    t = Thread(target=run)
-    t.daemon = True
-    t.start()
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
 if __name__ == '__main__':
     # Start the file cleanup task
-    delete_files_task()
-    keep_alive()
+    start_cleanup_thread()
+    run()